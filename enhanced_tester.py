@@ -12,18 +12,39 @@ import asyncio
 import aiohttp
 import time
 import socket
+import struct
 import json
 import re
 import subprocess
 import logging
+import os
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import ssl
-from dataclasses import dataclass, asdict
+import numpy as np
+from dataclasses import dataclass, asdict, replace
 
 logger = logging.getLogger(**name**)
 
+USER_AGENT = “Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36”
+
+# 整个进程共用一个SSL上下文，避免每个连接器重复加载证书
+
+_SSL_CTX = ssl.create_default_context()
+
+# IP地理位置缓存，出口IP变化不频繁，24小时内复用
+
+IP_CACHE_PATH = os.path.expanduser(“~/.cache/node_tester/ipinfo.json”)
+IP_CACHE_TTL = 24 * 3600
+
+# 仅在部分地区提供的流媒体服务 -> 可解锁的国家代码，出口不在其中时直接判定不支持
+
+REGION_LOCKED_SERVICES: Dict[str, frozenset] = {
+“bahamut”: frozenset({“TW”}),
+“bilibili”: frozenset({“HK”, “MO”, “TW”}),
+}
+
 @dataclass
 class NodeTestResult:
 “”“节点测试结果”””
@@ -66,33 +87,41 @@ class StreamingTester:
 “”“流媒体解锁检测器”””
 
 ```
-def __init__(self, timeout=10):
+# 页面关键字，按字节流式匹配，不解码整个页面；不支持的关键字优先
+NETFLIX_BLOCKED = re.compile(b"Not Available|" + "不可播放".encode())
+NETFLIX_AVAILABLE = re.compile(b"(?i:watch now)|" + "立即观看".encode())
+DISNEY_BLOCKED = re.compile(b"not available", re.I)
+DISNEY_AVAILABLE = re.compile(b"sign up|subscribe", re.I)
+BAHAMUT_BLOCKED = re.compile("地區限制|地区限制".encode())
+BAHAMUT_AVAILABLE = re.compile("動畫瘋|动画疯".encode())
+
+# 每个页面最多扫描1MiB；块之间保留的重叠字节需长于最长关键字
+SCAN_MAX_BYTES = 1024 * 1024
+SCAN_OVERLAP = 32
+
+def __init__(self, session: aiohttp.ClientSession, timeout=10):
+    self.session = session
     self.timeout = timeout
-    self.session = None
-    
-async def create_session(self, proxy_url=None):
-    """创建HTTP会话"""
-    connector = aiohttp.TCPConnector(
-        limit=10,
-        ssl=ssl.create_default_context(),
-        enable_cleanup_closed=True
-    )
-    
-    timeout = aiohttp.ClientTimeout(total=self.timeout)
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-    }
-    
-    if proxy_url:
-        # 这里需要根据实际代理协议配置
-        # 简化处理，实际使用时需要更完整的代理配置
-        pass
-        
-    self.session = aiohttp.ClientSession(
-        connector=connector,
-        timeout=timeout,
-        headers=headers
-    )
+
+async def _scan_body(self, response, blocked, available) -> Optional[bool]:
+    """流式扫描响应体：命中不支持的关键字立即返回False；
+    读完或达到扫描上限后，命中过支持的关键字返回True，否则返回None"""
+    found = False
+    scanned = 0
+    tail = b""
+    async for chunk in response.content.iter_chunked(16384):
+        buf = tail + chunk
+        if blocked.search(buf):
+            response.close()
+            return False
+        found = found or available.search(buf) is not None
+        scanned += len(chunk)
+        if scanned >= self.SCAN_MAX_BYTES:
+            response.close()
+            break
+        # 保留末尾几个字节，防止关键字跨块被截断
+        tail = buf[-self.SCAN_OVERLAP:]
+    return True if found else None
 
 async def test_netflix(self) -> str:
     """检测Netflix解锁状态"""
@@ -101,10 +130,10 @@ async def test_netflix(self) -> str:
         url = "https://www.netflix.com/title/81280792"  # 特定地区内容
         async with self.session.get(url) as response:
             if response.status == 200:
-                content = await response.text()
-                if "Not Available" in content or "不可播放" in content:
+                found = await self._scan_body(response, self.NETFLIX_BLOCKED, self.NETFLIX_AVAILABLE)
+                if found is False:
                     return "❌ 不支持"
-                elif "watch now" in content.lower() or "立即观看" in content:
+                elif found:
                     return "✅ 完整支持"
                 else:
                     return "⚠️ 部分支持"
@@ -138,10 +167,10 @@ async def test_disney_plus(self) -> str:
         url = "https://www.disneyplus.com/"
         async with self.session.get(url) as response:
             if response.status == 200:
-                content = await response.text()
-                if "not available" in content.lower():
+                found = await self._scan_body(response, self.DISNEY_BLOCKED, self.DISNEY_AVAILABLE)
+                if found is False:
                     return "❌ 不支持"
-                elif "sign up" in content.lower() or "subscribe" in content.lower():
+                elif found:
                     return "✅ 支持"
                 else:
                     return "⚠️ 部分支持"
@@ -182,10 +211,10 @@ async def test_bahamut(self) -> str:
         url = "https://ani.gamer.com.tw/"
         async with self.session.get(url) as response:
             if response.status == 200:
-                content = await response.text()
-                if "地區限制" in content or "地区限制" in content:
+                found = await self._scan_body(response, self.BAHAMUT_BLOCKED, self.BAHAMUT_AVAILABLE)
+                if found is False:
                     return "❌ 不支持"
-                elif "動畫瘋" in content or "动画疯" in content:
+                elif found:
                     return "✅ 支持"
                 else:
                     return "⚠️ 部分支持"
@@ -195,44 +224,56 @@ async def test_bahamut(self) -> str:
         logger.debug(f"巴哈姆特检测失败: {e}")
         return "❓ 检测失败"
 
-async def test_all_streaming(self) -> Dict[str, str]:
-    """测试所有流媒体服务"""
+async def test_all_streaming(self, country_code: str = "") -> Dict[str, str]:
+    """测试所有流媒体服务，已知出口地区时跳过该地区不可能解锁的服务"""
     results = {}
     
-    # 并发测试各个流媒体服务
-    tasks = [
-        ("netflix", self.test_netflix()),
-        ("youtube", self.test_youtube_premium()),
-        ("disney", self.test_disney_plus()),
-        ("bilibili", self.test_bilibili()),
-        ("bahamut", self.test_bahamut())
+    services = [
+        ("netflix", self.test_netflix),
+        ("youtube", self.test_youtube_premium),
+        ("disney", self.test_disney_plus),
+        ("bilibili", self.test_bilibili),
+        ("bahamut", self.test_bahamut)
     ]
     
-    for name, task in tasks:
-        try:
-            result = await asyncio.wait_for(task, timeout=self.timeout)
-            results[name] = result
-        except asyncio.TimeoutError:
+    # 并发测试各个流媒体服务
+    tasks = []
+    for name, test in services:
+        allowed = REGION_LOCKED_SERVICES.get(name)
+        if country_code and allowed and country_code not in allowed:
+            results[name] = "❌ 不支持"
+        else:
+            tasks.append((name, test()))
+    
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(task, timeout=self.timeout) for _, task in tasks),
+        return_exceptions=True
+    )
+    
+    for (name, _), result in zip(tasks, outcomes):
+        if isinstance(result, asyncio.TimeoutError):
             results[name] = "⏱️ 超时"
-        except Exception as e:
+        elif isinstance(result, Exception):
             results[name] = "❓ 检测失败"
-            logger.debug(f"{name}检测异常: {e}")
+            logger.debug(f"{name}检测异常: {result}")
+        else:
+            results[name] = result
     
     return results
-
-async def close(self):
-    """关闭会话"""
-    if self.session:
-        await self.session.close()
 ```
 
 class SpeedTester:
 “”“网络速度测试器”””
 
 ```
-def __init__(self, timeout=30):
+# 每次读取256KiB，最多测试10秒（测试文件都不超过10MB，不另设字节上限）
+CHUNK_SIZE = 256 * 1024
+MAX_SECONDS = 10
+
+def __init__(self, session: aiohttp.ClientSession, timeout=30):
+    self.session = session
     self.timeout = timeout
-    
+
 async def test_download_speed(self, proxy_url=None) -> float:
     """测试下载速度"""
     try:
@@ -244,66 +285,132 @@ async def test_download_speed(self, proxy_url=None) -> float:
             "https://proof.ovh.net/files/10Mb.dat"                  # 10MB
         ]
         
-        best_speed = 0
-        
-        for url in test_urls:
-            try:
-                speed = await self._download_test_single(url, proxy_url)
-                if speed > best_speed:
-                    best_speed = speed
-            except:
-                continue
-        
-        return best_speed
+        # 各镜像同时发起请求，只按响应头到达的先后选出镜像，测速只在选中的镜像上进行
+        response = await self._fastest_mirror(test_urls)
+        if response is None:
+            return 0
+        return await self._download_test_single(response)
         
     except Exception as e:
         logger.debug(f"下载速度测试失败: {e}")
         return 0
 
-async def _download_test_single(self, url: str, proxy_url=None) -> float:
-    """单个文件下载测试"""
-    connector = aiohttp.TCPConnector(limit=1)
+async def _open_mirror(self, url: str) -> Optional[aiohttp.ClientResponse]:
+    """请求单个镜像，收到响应头即返回，响应体留给调用方读取"""
     timeout = aiohttp.ClientTimeout(total=self.timeout)
+    response = await self.session.get(url, timeout=timeout)
+    if response.status != 200:
+        response.release()
+        return None
+    return response
+
+async def _fastest_mirror(self, urls: List[str]) -> Optional[aiohttp.ClientResponse]:
+    """返回最先收到响应头的镜像响应，其余请求取消，多余的响应关闭"""
+    tasks = [asyncio.ensure_future(self._open_mirror(url)) for url in urls]
+    winner = None
+    try:
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if winner is None and task.exception() is None:
+                    winner = task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+            if task.done() and not task.cancelled() and task.exception() is None:
+                response = task.result()
+                if response is not None and response is not winner:
+                    response.close()
+    return winner
+
+async def _download_test_single(self, response: aiohttp.ClientResponse) -> float:
+    """在选中的镜像上下载测速，从收到响应头之后开始计时"""
+    start_time = time.time()
+    downloaded = 0
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        start_time = time.time()
-        downloaded = 0
-        
-        async with session.get(url) as response:
-            if response.status == 200:
-                async for chunk in response.content.iter_chunked(8192):
-                    downloaded += len(chunk)
-                    
-                    # 限制测试时间，避免下载过大文件
-                    if time.time() - start_time > 10:  # 最多测试10秒
-                        break
-        
-        elapsed = time.time() - start_time
-        if elapsed > 0:
-            speed_mbps = (downloaded / 1024 / 1024) / elapsed  # MB/s
-            return speed_mbps
+    async with response:
+        try:
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                downloaded += len(chunk)
+                
+                # 限制测试时间，慢速链路上按已下载的部分计算
+                if time.time() - start_time > self.MAX_SECONDS:
+                    break
+        except asyncio.TimeoutError:
+            # 请求总超时，同样按已下载的部分计算
+            pass
+    
+    elapsed = time.time() - start_time
+    if elapsed > 0:
+        speed_mbps = (downloaded / 1024 / 1024) / elapsed  # MB/s
+        return speed_mbps
         
     return 0
 
-async def test_upload_speed(self, proxy_url=None) -> float:
+def test_upload_speed(self, download_speed: float) -> float:
     """测试上传速度（简化版）"""
-    try:
-        # 上传测试相对复杂，这里返回下载速度的70%作为估算
-        download_speed = await self.test_download_speed(proxy_url)
-        return download_speed * 0.7
-    except:
-        return 0
+    # 上传测试相对复杂，这里直接用已测得下载速度的70%作为估算
+    return download_speed * 0.7
 ```
 
 class IPInfoTester:
 “”“IP信息检测器”””
 
 ```
-def __init__(self, timeout=10):
+def __init__(self, session: aiohttp.ClientSession, timeout=10,
+             cache_path=IP_CACHE_PATH, cache_ttl=IP_CACHE_TTL):
+    self.session = session
     self.timeout = timeout
+    self.cache_path = cache_path
+    self.cache_ttl = cache_ttl
+    self._cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+def load_cache(self):
+    """从磁盘加载未过期的IP信息缓存"""
+    try:
+        with open(self.cache_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    if not isinstance(entries, dict):
+        return
+    
+    now = time.time()
+    for key, entry in entries.items():
+        # 跳过格式不对的条目（文件被手动修改或来自旧版本）
+        try:
+            ts, info = entry
+            if now - ts < self.cache_ttl and isinstance(info, dict):
+                self._cache[key] = (ts, info)
+        except (TypeError, ValueError):
+            continue
+
+def save_cache(self):
+    """将IP信息缓存写回磁盘（先写临时文件再原子替换）"""
+    try:
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+    except OSError as e:
+        logger.debug(f"IP信息缓存保存失败: {e}")
 
 async def get_ip_info(self, proxy_url=None) -> Dict[str, str]:
-    """获取IP地理位置信息"""
+    """获取IP地理位置信息（按代理地址缓存）"""
+    key = proxy_url or "direct"
+    cached = self._cache.get(key)
+    if cached and time.time() - cached[0] < self.cache_ttl:
+        return cached[1]
+    
+    result = await self._lookup_ip_info(proxy_url)
+    if result.get("country") not in ("", "未知"):
+        self._cache[key] = (time.time(), result)
+    return result
+
+async def _lookup_ip_info(self, proxy_url=None) -> Dict[str, str]:
+    """依次尝试各个IP API"""
     try:
         # 使用多个IP检测API
         apis = [
@@ -316,6 +423,10 @@ async def get_ip_info(self, proxy_url=None) -> Dict[str, str]:
         for api in apis:
             try:
                 result = await self._query_ip_api(api, proxy_url)
+                if result and result["country"] == "未知" and result["ip"]:
+                    # 仅返回IP的API，再用ip-api.com补全地理位置
+                    ip = result["ip"].split(",")[0].strip()
+                    result = await self._query_ip_api(f"http://ip-api.com/json/{ip}", proxy_url) or result
                 if result:
                     return result
             except:
@@ -334,43 +445,43 @@ async def get_ip_info(self, proxy_url=None) -> Dict[str, str]:
 
 async def _query_ip_api(self, api_url: str, proxy_url=None) -> Optional[Dict[str, str]]:
     """查询单个IP API"""
-    connector = aiohttp.TCPConnector(limit=1)
     timeout = aiohttp.ClientTimeout(total=self.timeout)
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        async with session.get(api_url) as response:
-            if response.status == 200:
-                data = await response.json()
-                
-                # 根据不同API格式解析
-                if "ipapi.co" in api_url:
-                    return {
-                        "ip": data.get("ip", ""),
-                        "country": data.get("country_name", ""),
-                        "city": data.get("city", ""),
-                        "isp": data.get("org", "")
-                    }
-                elif "ip-api.com" in api_url:
-                    return {
-                        "ip": data.get("query", ""),
-                        "country": data.get("country", ""),
-                        "city": data.get("city", ""),
-                        "isp": data.get("isp", "")
-                    }
-                elif "httpbin.org" in api_url:
-                    return {
-                        "ip": data.get("origin", ""),
-                        "country": "未知",
-                        "city": "未知", 
-                        "isp": "未知"
-                    }
-                elif "ipify.org" in api_url:
-                    return {
-                        "ip": data.get("ip", ""),
-                        "country": "未知",
-                        "city": "未知",
-                        "isp": "未知"
-                    }
+    async with self.session.get(api_url, timeout=timeout) as response:
+        if response.status == 200:
+            data = await response.json()
+            
+            # 根据不同API格式解析
+            if "ipapi.co" in api_url:
+                return {
+                    "ip": data.get("ip", ""),
+                    "country": data.get("country_name", ""),
+                    "country_code": data.get("country_code", ""),
+                    "city": data.get("city", ""),
+                    "isp": data.get("org", "")
+                }
+            elif "ip-api.com" in api_url:
+                return {
+                    "ip": data.get("query", ""),
+                    "country": data.get("country", ""),
+                    "country_code": data.get("countryCode", ""),
+                    "city": data.get("city", ""),
+                    "isp": data.get("isp", "")
+                }
+            elif "httpbin.org" in api_url:
+                return {
+                    "ip": data.get("origin", ""),
+                    "country": "未知",
+                    "city": "未知", 
+                    "isp": "未知"
+                }
+            elif "ipify.org" in api_url:
+                return {
+                    "ip": data.get("ip", ""),
+                    "country": "未知",
+                    "city": "未知",
+                    "isp": "未知"
+                }
     
     return None
 ```
@@ -385,22 +496,66 @@ def __init__(self, config=None):
         "enable_streaming_test": True, 
         "enable_ip_test": True,
         "test_timeout": 30,
-        "max_concurrent": 5
+        "max_concurrent": 5,
+        "dns_nameservers": ["1.1.1.1", "8.8.8.8"]
     }
+    self.session: Optional[aiohttp.ClientSession] = None
+    self.ip_tester: Optional[IPInfoTester] = None
+    self.speed_tester: Optional[SpeedTester] = None
+    self.streaming_tester: Optional[StreamingTester] = None
+
+async def __aenter__(self):
+    """创建整批测试共享的HTTP会话"""
+    max_concurrent = self.config.get("max_concurrent", 5)
+    # aiodns异步解析，未配置DNS服务器时使用系统配置
+    nameservers = self.config.get("dns_nameservers")
+    resolver = aiohttp.AsyncResolver(nameservers=nameservers) if nameservers else aiohttp.AsyncResolver()
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrent * 8,
+        limit_per_host=4,
+        resolver=resolver,
+        ttl_dns_cache=600,
+        use_dns_cache=True,
+        enable_cleanup_closed=True,
+        ssl=_SSL_CTX
+    )
+    
+    self.session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=self.config.get("test_timeout", 30)),
+        headers={'User-Agent': USER_AGENT}
+    )
+    self.ip_tester = IPInfoTester(self.session)
+    self.ip_tester.load_cache()
+    self.speed_tester = SpeedTester(self.session)
+    self.streaming_tester = StreamingTester(self.session)
+    return self
+
+async def __aexit__(self, exc_type, exc, tb):
+    """关闭共享会话"""
+    if self.ip_tester:
+        self.ip_tester.save_cache()
+    if self.session:
+        await self.session.close()
+        self.session = None
     
-def tcp_ping_test(self, host: str, port: int) -> Tuple[bool, float]:
+async def tcp_ping_test(self, host: str, port: int) -> Tuple[bool, float]:
     """TCP连接测试"""
+    loop = asyncio.get_running_loop()
     try:
-        start_time = time.time()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(10)
-        
-        result = sock.connect_ex((host, port))
-        ping_time = (time.time() - start_time) * 1000
-        
-        sock.close()
-        
-        return result == 0, ping_time if result == 0 else -1
+        start_time = loop.time()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port),
+            timeout=10
+        )
+        try:
+            return True, (loop.time() - start_time) * 1000
+        finally:
+            # SO_LINGER=0 直接发送RST关闭，不进入TIME_WAIT
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            writer.close()
         
     except Exception as e:
         logger.debug(f"TCP ping失败 {host}:{port} - {e}")
@@ -410,35 +565,32 @@ async def http_ping_test(self, proxy_url=None) -> float:
     """HTTP延迟测试"""
     try:
         start_time = time.time()
-        
-        connector = aiohttp.TCPConnector(limit=1)
         timeout = aiohttp.ClientTimeout(total=10)
         
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            # 使用Google生成204，速度快且稳定
-            async with session.get("http://www.gstatic.com/generate_204") as response:
-                await response.read()
-                
+        # 使用Google生成204，速度快且稳定
+        async with self.session.get("http://www.gstatic.com/generate_204", timeout=timeout) as response:
+            await response.read()
+            
         return (time.time() - start_time) * 1000
         
     except Exception as e:
         logger.debug(f"HTTP ping失败: {e}")
         return -1
 
-async def test_single_node(self, node) -> NodeTestResult:
+async def test_single_node(self, node, test_time: Optional[str] = None) -> NodeTestResult:
     """测试单个节点"""
     result = NodeTestResult(
         name=node.name,
         server=node.server,
         port=node.port,
         protocol=node.protocol,
-        test_time=time.strftime("%Y-%m-%d %H:%M:%S")
+        test_time=test_time or time.strftime("%Y-%m-%d %H:%M:%S")
     )
     
     try:
         # 1. TCP连接测试
         logger.info(f"测试节点: {node.name}")
-        is_alive, tcp_ping = self.tcp_ping_test(node.server, node.port)
+        is_alive, tcp_ping = await self.tcp_ping_test(node.server, node.port)
         result.is_alive = is_alive
         result.tcp_ping = tcp_ping
         
@@ -449,38 +601,48 @@ async def test_single_node(self, node) -> NodeTestResult:
         # 构建代理URL（这里需要根据实际协议实现）
         proxy_url = self._build_proxy_url(node)
         
-        # 2. HTTP延迟测试
+        # 2-5. HTTP延迟、IP信息、速度、流媒体解锁并发执行
+        #      （流媒体检测会等待IP信息，以跳过出口地区不可能解锁的服务）
+        probes = {}
         if proxy_url:
-            result.http_ping = await self.http_ping_test(proxy_url)
-        
-        # 3. IP信息检测
+            probes["http_ping"] = self.http_ping_test(proxy_url)
+        ip_task = None
         if self.config.get("enable_ip_test"):
-            ip_tester = IPInfoTester()
-            ip_info = await ip_tester.get_ip_info(proxy_url)
+            ip_task = asyncio.ensure_future(self.ip_tester.get_ip_info(proxy_url))
+            probes["ip_info"] = ip_task
+        if self.config.get("enable_speed_test"):
+            probes["download_speed"] = self.speed_tester.test_download_speed(proxy_url)
+        if self.config.get("enable_streaming_test"):
+            probes["streaming"] = self._test_streaming_after_ip(ip_task)
+        
+        outcomes = dict(zip(probes, await asyncio.gather(*probes.values(), return_exceptions=True)))
+        for name, outcome in outcomes.items():
+            if isinstance(outcome, Exception):
+                logger.debug(f"{name}测试异常 {node.name}: {outcome}")
+        
+        http_ping = outcomes.get("http_ping")
+        if isinstance(http_ping, (int, float)):
+            result.http_ping = http_ping
+        
+        ip_info = outcomes.get("ip_info")
+        if isinstance(ip_info, dict):
             result.real_ip = ip_info.get("ip", "")
             result.country = ip_info.get("country", "")
             result.city = ip_info.get("city", "")
             result.isp = ip_info.get("isp", "")
         
-        # 4. 速度测试
-        if self.config.get("enable_speed_test"):
-            speed_tester = SpeedTester()
-            result.download_speed = await speed_tester.test_download_speed(proxy_url)
-            result.upload_speed = await speed_tester.test_upload_speed(proxy_url)
+        download_speed = outcomes.get("download_speed")
+        if isinstance(download_speed, (int, float)):
+            result.download_speed = download_speed
+            result.upload_speed = self.speed_tester.test_upload_speed(download_speed)
         
-        # 5. 流媒体解锁测试
-        if self.config.get("enable_streaming_test"):
-            streaming_tester = StreamingTester()
-            await streaming_tester.create_session(proxy_url)
-            
-            streaming_results = await streaming_tester.test_all_streaming()
+        streaming_results = outcomes.get("streaming")
+        if isinstance(streaming_results, dict):
             result.netflix = streaming_results.get("netflix", "未测试")
             result.youtube = streaming_results.get("youtube", "未测试")
             result.disney = streaming_results.get("disney", "未测试")
             result.bilibili = streaming_results.get("bilibili", "未测试")
             result.bahamut = streaming_results.get("bahamut", "未测试")
-            
-            await streaming_tester.close()
         
         logger.info(f"✅ 节点 {node.name} 测试完成")
         
@@ -490,6 +652,14 @@ async def test_single_node(self, node) -> NodeTestResult:
     
     return result
 
+async def _test_streaming_after_ip(self, ip_task) -> Dict[str, str]:
+    """等待IP检测得到出口地区后再进行流媒体检测"""
+    country_code = ""
+    if ip_task is not None:
+        ip_info = await ip_task
+        country_code = ip_info.get("country_code", "")
+    return await self.streaming_tester.test_all_streaming(country_code)
+
 def _build_proxy_url(self, node) -> Optional[str]:
     """构建代理URL（简化版）"""
     # 这里需要根据具体的代理协议来实现
@@ -508,35 +678,44 @@ async def test_nodes_batch(self, nodes: List) -> List[NodeTestResult]:
     """批量测试节点"""
     results = []
     semaphore = asyncio.Semaphore(self.config.get("max_concurrent", 5))
+    # 同一批次的节点共用一个测试时间
+    batch_time = time.strftime("%Y-%m-%d %H:%M:%S")
     
     async def test_with_semaphore(node):
         async with semaphore:
-            return await self.test_single_node(node)
+            return await self.test_single_node(node, batch_time)
+    
+    # 相同 (server, port, protocol) 的节点探测结果一致，只测试一次
+    groups: Dict[Tuple[str, int, str], List] = {}
+    for node in nodes:
+        groups.setdefault((node.server, node.port, node.protocol), []).append(node)
     
-    # 创建所有测试任务
-    tasks = [test_with_semaphore(node) for node in nodes]
+    # 每组只为第一个节点创建测试任务
+    tasks = [test_with_semaphore(group[0]) for group in groups.values()]
     
     # 执行批量测试
-    logger.info(f"开始批量测试 {len(nodes)} 个节点...")
+    logger.info(f"开始批量测试 {len(nodes)} 个节点（{len(groups)} 个不同端点）...")
     start_time = time.time()
     
     results = await asyncio.gather(*tasks, return_exceptions=True)
     
-    # 处理异常结果
-    valid_results = []
-    for i, result in enumerate(results):
-        if isinstance(result, Exception):
-            error_result = NodeTestResult(
-                name=nodes[i].name,
-                server=nodes[i].server,
-                port=nodes[i].port,
-                protocol=nodes[i].protocol,
-                error_msg=str(result),
-                test_time=time.strftime("%Y-%m-%d %H:%M:%S")
-            )
-            valid_results.append(error_result)
-        else:
-            valid_results.append(result)
+    # 处理异常结果，并把结果分发给同组的其他节点
+    results_by_node = {}
+    for group, result in zip(groups.values(), results):
+        for node in group:
+            if isinstance(result, Exception):
+                results_by_node[id(node)] = NodeTestResult(
+                    name=node.name,
+                    server=node.server,
+                    port=node.port,
+                    protocol=node.protocol,
+                    error_msg=str(result),
+                    test_time=batch_time
+                )
+            else:
+                results_by_node[id(node)] = replace(result, name=node.name)
+    
+    valid_results = [results_by_node[id(node)] for node in nodes]
     
     elapsed = time.time() - start_time
     logger.info(f"✅ 批量测试完成，耗时 {elapsed:.2f} 秒")
@@ -545,35 +724,37 @@ async def test_nodes_batch(self, nodes: List) -> List[NodeTestResult]:
 
 def generate_test_report(self, results: List[NodeTestResult]) -> Dict:
     """生成测试报告"""
-    alive_nodes = [r for r in results if r.is_alive]
-    dead_nodes = [r for r in results if not r.is_alive]
+    # 按列取出各字段，后续统计都在数组上完成
+    n = len(results)
+    alive = np.fromiter((r.is_alive for r in results), dtype=bool, count=n)
+    tcp_ping = np.fromiter((r.tcp_ping for r in results), dtype=np.float64, count=n)
+    download = np.fromiter((r.download_speed for r in results), dtype=np.float64, count=n)
+    alive_count = int(alive.sum())
     
     # 统计信息
     stats = {
-        "total_nodes": len(results),
-        "alive_nodes": len(alive_nodes),
-        "dead_nodes": len(dead_nodes),
-        "alive_rate": len(alive_nodes) / len(results) * 100 if results else 0,
-        "avg_tcp_ping": sum(r.tcp_ping for r in alive_nodes if r.tcp_ping > 0) / len(alive_nodes) if alive_nodes else 0,
-        "avg_download_speed": sum(r.download_speed for r in alive_nodes) / len(alive_nodes) if alive_nodes else 0,
+        "total_nodes": n,
+        "alive_nodes": alive_count,
+        "dead_nodes": n - alive_count,
+        "alive_rate": alive_count / n * 100 if n else 0,
+        "avg_tcp_ping": float(tcp_ping[alive & (tcp_ping > 0)].sum() / alive_count) if alive_count else 0,
+        "avg_download_speed": float(download[alive].mean()) if alive_count else 0,
     }
     
     # 流媒体解锁统计
     streaming_stats = {}
     for service in ["netflix", "youtube", "disney", "bilibili", "bahamut"]:
-        supported = len([r for r in alive_nodes if getattr(r, service).startswith("✅")])
+        supported_col = np.fromiter((getattr(r, service).startswith("✅") for r in results), dtype=bool, count=n)
+        supported = int((supported_col & alive).sum())
         streaming_stats[service] = {
             "supported": supported,
-            "rate": supported / len(alive_nodes) * 100 if alive_nodes else 0
+            "rate": supported / alive_count * 100 if alive_count else 0
         }
     
     # 地区分布
-    country_stats = {}
-    for result in alive_nodes:
-        country = result.country or "未知"
-        if country not in country_stats:
-            country_stats[country] = 0
-        country_stats[country] += 1
+    countries = np.array([r.country or "未知" for r in results], dtype=object)[alive]
+    names, counts = np.unique(countries.astype(str), return_counts=True)
+    country_stats = {str(name): int(count) for name, count in zip(names, counts)}
     
     return {
         "test_time": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -613,14 +794,12 @@ config = {
     "max_concurrent": 3
 }
 
-# 创建测试器
-tester = EnhancedNodeTester(config)
-
-# 执行测试
-results = await tester.test_nodes_batch(test_nodes)
+# 创建测试器并执行测试
+async with EnhancedNodeTester(config) as tester:
+    results = await tester.test_nodes_batch(test_nodes)
 
-# 生成报告
-report = tester.generate_test_report(results)
+    # 生成报告
+    report = tester.generate_test_report(results)
 
 # 输出报告
 print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -1,26 +1,28 @@
 import os
-import json
-import requests
+import multiprocessing
+import orjson
+import asyncio
+import aiohttp
 import base64
-import hashlib
+import xxhash
+import ahocorasick
 
-def fetch_subscription(url):
+PROTO_PREFIXES = ('vmess://', 'vless://', 'trojan://', 'ss://')
+
+async def fetch_subscription(session, url):
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+            response.raise_for_status()
+            content = (await response.text()).strip()
 
-        content = response.text.strip()
         try:
             decoded = base64.b64decode(content).decode('utf-8')
             content = decoded
         except:
             pass
 
-        links = [line.strip() for line in content.split('\n')
-                 if line.strip() and any(line.startswith(p) for p in ['vmess://', 'vless://', 'trojan://', 'ss://'])]
+        links = [line.strip() for line in content.splitlines()
+                 if line.startswith(PROTO_PREFIXES)]
 
         print(f"从 {url[:50]}... 获取到 {len(links)} 个节点")
         return links
@@ -29,9 +31,8 @@ def fetch_subscription(url):
         return []
 
 def parse_vmess(url):
-    import json
     try:
-        data = json.loads(base64.b64decode(url[8:]).decode('utf-8'))
+        data = orjson.loads(base64.b64decode(url[8:]))
         return {
             'protocol': 'vmess',
             'name': data.get('ps', ''),
@@ -54,21 +55,49 @@ def parse_node(url):
     # TODO: 其他协议解析，可继续补充
     return None
 
+COUNTRY_KEYWORDS = {
+    'HK': ['hk', 'hong-kong', 'hongkong', '香港'],
+    'TW': ['tw', 'taiwan', 'taipei', '台湾'],
+    'US': ['us', 'usa', 'america', 'united-states'],
+    'JP': ['jp', 'japan', 'tokyo', '日本'],
+    'SG': ['sg', 'singapore', '新加坡'],
+    'KR': ['kr', 'korea', 'seoul', '韩国']
+}
+
+# 所有关键词编译成一个自动机，一次扫描即可找出全部命中的国家；
+# 值为国家在 COUNTRY_KEYWORDS 中的顺序，多个命中时按原有优先级取第一个
+COUNTRY_AUTOMATON = ahocorasick.Automaton()
+for _rank, (_code, _keywords) in enumerate(COUNTRY_KEYWORDS.items()):
+    for _keyword in _keywords:
+        COUNTRY_AUTOMATON.add_word(_keyword, (_rank, _code))
+COUNTRY_AUTOMATON.make_automaton()
+
 def detect_country(server, name):
     text = (server + ' ' + name).lower()
-    countries = {
-        'HK': ['hk', 'hong-kong', 'hongkong', '香港'],
-        'TW': ['tw', 'taiwan', 'taipei', '台湾'],
-        'US': ['us', 'usa', 'america', 'united-states'],
-        'JP': ['jp', 'japan', 'tokyo', '日本'],
-        'SG': ['sg', 'singapore', '新加坡'],
-        'KR': ['kr', 'korea', 'seoul', '韩国']
-    }
-    for code, keywords in countries.items():
-        if any(k in text for k in keywords):
-            return code
+    matches = [value for _, value in COUNTRY_AUTOMATON.iter(text)]
+    if matches:
+        return min(matches)[1]
     return 'UN'
 
+async def fetch_all(subscription_urls):
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    connector = aiohttp.TCPConnector(limit=32, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        results = await asyncio.gather(*[fetch_subscription(session, url) for url in subscription_urls])
+
+    return [link for links in results for link in links]
+
+def parse_and_classify(url):
+    node = parse_node(url)
+    if node and node['server'] and node['port']:
+        node['country'] = detect_country(node['server'], node['name'])
+        hash_str = f"{node['server']}:{node['port']}:{node['uuid']}"
+        node['hash'] = xxhash.xxh3_64_intdigest(hash_str.encode())
+        return node
+    return None
+
 def main():
     env_subs = os.environ.get('SUBSCRIPTION_URLS', '')
     if not env_subs:
@@ -78,21 +107,16 @@ def main():
     subscription_urls = [url.strip() for url in env_subs.split(',') if url.strip()]
     print(f"📋 配置了 {len(subscription_urls)} 个订阅源")
 
-    all_links = []
-    for url in subscription_urls:
-        links = fetch_subscription(url)
-        all_links.extend(links)
+    all_links = asyncio.run(fetch_all(subscription_urls))
 
     print(f"📊 总共获取 {len(all_links)} 个原始节点")
 
-    nodes = []
-    for url in all_links:
-        node = parse_node(url)
-        if node and node['server'] and node['port']:
-            node['country'] = detect_country(node['server'], node['name'])
-            hash_str = f"{node['server']}:{node['port']}:{node['uuid']}"
-            node['hash'] = hashlib.md5(hash_str.encode()).hexdigest()
-            nodes.append(node)
+    # 多个订阅源常有完全相同的链接，解析前先按原始链接去重（保持顺序）
+    all_links = list(dict.fromkeys(all_links))
+
+    with multiprocessing.Pool(os.cpu_count()) as pool:
+        parsed = pool.map(parse_and_classify, all_links, chunksize=64)
+    nodes = [node for node in parsed if node]
 
     seen_hashes = set()
     unique_nodes = []
@@ -110,8 +134,8 @@ def main():
         unique_nodes = unique_nodes[:max_test]
         print(f"📊 限制测试节点数量为 {max_test}")
 
-    with open('raw_nodes.json', 'w', encoding='utf-8') as f:
-        json.dump(unique_nodes, f, ensure_ascii=False, indent=2)
+    with open('raw_nodes.json', 'wb') as f:
+        f.write(orjson.dumps(unique_nodes, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     print("✅ 节点获取完成，准备进行测试")
 
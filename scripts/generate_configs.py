@@ -1,7 +1,10 @@
-import json
+import orjson
 import base64
 import time
 import os
+from collections import defaultdict
+
+import yaml
 
 def generate_clash_config(nodes):
     proxies = []
@@ -33,12 +36,9 @@ def generate_clash_config(nodes):
                     proxy['ws-opts']['headers'] = {'Host': node['host']}
             proxies.append(proxy)
 
-    country_groups = {}
+    country_groups = defaultdict(list)
     for node in nodes:
-        country = node['country']
-        if country not in country_groups:
-            country_groups[country] = []
-        country_groups[country].append(node['enhanced_name'])
+        country_groups[node['country']].append(node['enhanced_name'])
 
     proxy_groups = [
         {
@@ -86,8 +86,8 @@ def generate_clash_config(nodes):
     return config
 
 def main():
-    with open('test_results.json', 'r', encoding='utf-8') as f:
-        test_report = json.load(f)
+    with open('test_results.json', 'rb') as f:
+        test_report = orjson.loads(f.read())
 
     alive_nodes = [n for n in test_report['results'] if n['is_alive']]
     for node in alive_nodes:
@@ -96,9 +96,10 @@ def main():
 
     config = generate_clash_config(alive_nodes)
 
+    # 使用纯Python的 SafeDumper：libyaml 会把BMP以外的字符（分组名和节点名里的emoji）转义成 \U 形式，
+    # 生成的配置文件需要能直接阅读
     with open('clash_generated.yaml', 'w', encoding='utf-8') as f:
-        import yaml
-        yaml.dump(config, f, allow_unicode=True, sort_keys=False)
+        yaml.dump(config, f, Dumper=yaml.SafeDumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
 
     print("✅ Clash 配置文件生成成功: clash_generated.yaml")
 
@@ -1,176 +1,408 @@
 import asyncio
-import aiohttp
-import json
+import errno
+import aiodns
+import httpx
+import orjson
+import socket
 import time
 import os
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
 
-async def tcp_ping_test(host, port, timeout=5):
+# 探测失败时预期会出现的异常（超时、连接错误、HTTP错误）
+PROBE_ERRORS = (asyncio.TimeoutError, OSError, httpx.HTTPError)
+
+# 这些错误说明是本机资源耗尽（文件描述符、缓冲区、本地端口），而不是节点不可用
+LOCAL_OVERLOAD_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM, errno.EADDRNOTAVAIL}
+
+class LocalOverload(Exception):
+    pass
+
+# 单个节点的测试结果，写入JSON时由 orjson 直接序列化
+@dataclass(slots=True)
+class NodeResult:
+    name: str
+    server: str
+    port: int
+    protocol: str
+    country: str
+    is_alive: bool = False
+    tcp_ping: float = -1
+    http_ping: float = -1
+    download_speed: float = 0
+    ip_info: str = '未知'
+    streaming: dict = field(default_factory=dict)
+    test_time: str = ''
+    error: str = ''
+
+_HTTP_PING = -1
+_DOWNLOAD_SPEED = 0
+_IP_INFO = '未知'
+_STREAMING = {}
+_LOG_QUEUE = None
+
+# 并发测试时的日志先放入队列，由后台任务合并写出，避免每条日志一次写系统调用
+def log(msg):
+    if _LOG_QUEUE is None:
+        print(msg)
+    else:
+        _LOG_QUEUE.put_nowait(msg + "\n")
+
+async def log_writer(queue, batch_size=32, flush_interval=0.1):
+    loop = asyncio.get_running_loop()
+    while True:
+        lines = [await queue.get()]
+        deadline = loop.time() + flush_interval
+        while len(lines) < batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                lines.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        sys.stdout.write(''.join(lines))
+        sys.stdout.flush()
+        for _ in lines:
+            queue.task_done()
+
+async def tcp_ping_test(host, port, timeout=5, raise_timeout=False, family=socket.AF_INET):
+    loop = asyncio.get_running_loop()
     try:
-        start_time = time.time()
-        _, writer = await asyncio.wait_for(
-            asyncio.open_connection(host, port),
-            timeout=timeout
-        )
-        ping_time = (time.time() - start_time) * 1000
-        writer.close()
-        await writer.wait_closed()
-        return True, ping_time
-    except:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+    except OSError as e:
+        if e.errno in LOCAL_OVERLOAD_ERRNOS:
+            raise LocalOverload(str(e)) from e
+        raise
+    sock.setblocking(False)
+    try:
+        start_time = loop.time()
+        await asyncio.wait_for(loop.sock_connect(sock, (host, int(port))), timeout)
+        return True, (loop.time() - start_time) * 1000
+    except asyncio.TimeoutError:
+        if raise_timeout:
+            raise
+        return False, -1
+    except OSError as e:
+        if e.errno in LOCAL_OVERLOAD_ERRNOS:
+            raise LocalOverload(str(e)) from e
         return False, -1
+    finally:
+        sock.close()
 
-async def http_speed_test(session, test_url="http://www.gstatic.com/generate_204"):
+# 先用短超时探测，大多数死节点在1.5秒内就能判定；只有超时的节点才用长超时重试一次
+async def tcp_ping_staged(host, port, first_timeout=1.5, retry_timeout=4.0, family=socket.AF_INET):
     try:
-        start_time = time.time()
-        async with session.get(test_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
-            await response.read()
-            return (time.time() - start_time) * 1000
-    except:
+        return await tcp_ping_test(host, port, first_timeout, raise_timeout=True, family=family)
+    except asyncio.TimeoutError:
+        return await tcp_ping_test(host, port, retry_timeout, family=family)
+
+# 测试开始前一次性并发解析所有节点域名，TCP ping 直接连IP，测得的延迟不含DNS时间
+# 结果为 域名 -> (地址族, IP)，有IPv4地址时优先用IPv4，只有IPv6地址的节点用IPv6；解析失败的域名保持原样
+async def resolve_hosts(resolver, hosts):
+    hosts = list(hosts)
+    answers = await asyncio.gather(
+        *[resolver.getaddrinfo(host, family=socket.AF_UNSPEC) for host in hosts], return_exceptions=True
+    )
+    resolved = {}
+    for host, answer in zip(hosts, answers):
+        if isinstance(answer, BaseException) or not answer.nodes:
+            resolved[host] = (socket.AF_INET, host)
+            continue
+        addr_node = min(answer.nodes, key=lambda n: n.family != socket.AF_INET)
+        resolved[host] = (addr_node.family, addr_node.addr[0].decode())
+    return resolved
+
+async def http_speed_test(client, test_url="http://www.gstatic.com/generate_204"):
+    loop = asyncio.get_running_loop()
+    try:
+        start_time = loop.time()
+        await client.head(test_url, timeout=10)
+        return (loop.time() - start_time) * 1000
+    except PROBE_ERRORS:
         return -1
 
-async def download_speed_test(session, size_mb=1):
+async def download_speed_test(client, size_mb=1):
+    loop = asyncio.get_running_loop()
     try:
         test_url = "https://proof.ovh.net/files/1Mb.dat"
-        start_time = time.time()
-
-        async with session.get(test_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
-            if response.status == 200:
-                downloaded = 0
-                async for chunk in response.content.iter_chunked(8192):
-                    downloaded += len(chunk)
-                    if time.time() - start_time > 10:
-                        break
-                elapsed = time.time() - start_time
+        start_time = loop.time()
+
+        async with client.stream('GET', test_url, timeout=15) as response:
+            if response.status_code == 200:
+                # 整体读取，由 wait_for 限制最多10秒；超时则按已接收的字节数计算
+                try:
+                    data = await asyncio.wait_for(response.aread(), timeout=10)
+                    downloaded = len(data)
+                except asyncio.TimeoutError:
+                    downloaded = response.num_bytes_downloaded
+                elapsed = loop.time() - start_time
                 if elapsed > 0:
                     speed_mbps = (downloaded / 1024 / 1024) / elapsed
                     return speed_mbps
         return 0
-    except:
+    except PROBE_ERRORS:
         return 0
 
-async def get_ip_info(session):
+async def get_ip_info(client):
     try:
-        async with session.get("https://httpbin.org/ip",
-                               timeout=aiohttp.ClientTimeout(total=10)) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("origin", "未知")
+        response = await client.get("https://httpbin.org/ip", timeout=10)
+        if response.status_code == 200:
+            return response.json().get("origin", "未知")
         return "未知"
-    except:
+    except PROBE_ERRORS + (ValueError,):
         return "检测失败"
 
-async def test_streaming_unlock(session):
-    results = {}
+async def test_netflix(client):
     try:
-        async with session.get("https://www.netflix.com/",
-                               timeout=aiohttp.ClientTimeout(total=10)) as response:
-            if response.status == 200:
-                content = await response.text()
-                if "Not Available" in content:
-                    results['netflix'] = "❌ 不支持"
-                else:
-                    results['netflix'] = "✅ 可能支持"
-            else:
-                results['netflix'] = "❓ 检测失败"
-    except:
-        results['netflix'] = "❓ 超时"
+        # 只需判断关键字，读取页面开头部分即可，不解码整个页面
+        async with client.stream('GET', "https://www.netflix.com/",
+                                 headers={'Range': 'bytes=0-4095'}, follow_redirects=True,
+                                 timeout=10) as response:
+            if response.status_code not in (200, 206):
+                return "❓ 检测失败"
+            content = b''
+            async for chunk in response.aiter_bytes():
+                content += chunk
+                if len(content) >= 4096:
+                    break
+            if b"Not Available" in content[:4096]:
+                return "❌ 不支持"
+            return "✅ 可能支持"
+    except PROBE_ERRORS:
+        return "❓ 超时"
 
+async def test_youtube(client):
     try:
-        async with session.get("https://www.youtube.com/",
-                               timeout=aiohttp.ClientTimeout(total=10)) as response:
-            if response.status == 200:
-                results['youtube'] = "✅ 可访问"
-            else:
-                results['youtube'] = "❌ 无法访问"
-    except:
-        results['youtube'] = "❓ 超时"
-    return results
-
-async def test_single_node(node, test_mode):
-    result = {
-        'name': node['name'],
-        'server': node['server'],
-        'port': node['port'],
-        'protocol': node['protocol'],
-        'country': node['country'],
-        'is_alive': False,
-        'tcp_ping': -1,
-        'http_ping': -1,
-        'download_speed': 0,
-        'ip_info': '未知',
-        'streaming': {},
-        'test_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'error': ''
-    }
+        response = await client.head("https://www.youtube.com/", follow_redirects=True, timeout=10)
+        if response.status_code == 200:
+            return "✅ 可访问"
+        return "❌ 无法访问"
+    except PROBE_ERRORS:
+        return "❓ 超时"
+
+async def test_streaming_unlock(client):
+    netflix, youtube = await asyncio.gather(test_netflix(client), test_youtube(client))
+    return {'netflix': netflix, 'youtube': youtube}
+
+# 按测试模式区分的结果填充，TCP ping 通过后执行；启动时根据 TEST_MODE 选定一个
+# HTTP探测测的都是本机出口，在 main() 中整次运行只测一次，这里只复制结果
+def _test_tcp_only(result):
+    pass
+
+def _test_speed(result):
+    result.http_ping = _HTTP_PING
+    result.download_speed = _DOWNLOAD_SPEED
+
+def _test_full(result):
+    _test_speed(result)
+    result.ip_info = _IP_INFO
+    result.streaming = dict(_STREAMING)
+
+TEST_FUNCTIONS = {
+    'speed': _test_speed,
+    'full': _test_full,
+}
+
+def new_result(node, test_time):
+    return NodeResult(
+        name=node['name'],
+        server=node['server'],
+        port=node['port'],
+        protocol=node['protocol'],
+        country=node['country'],
+        test_time=test_time
+    )
+
+async def test_single_node(node, test_fn, resolved_hosts, test_time):
+    result = new_result(node, test_time)
 
     try:
-        print(f"🧪 测试节点: {node['name']}")
+        log(f"🧪 测试节点: {node['name']}")
 
-        is_alive, tcp_ping = await tcp_ping_test(node['server'], node['port'])
-        result['is_alive'] = is_alive
-        result['tcp_ping'] = tcp_ping
+        family, host = resolved_hosts.get(node['server'], (socket.AF_INET, node['server']))
+        is_alive, tcp_ping = await tcp_ping_staged(host, node['port'], family=family)
+        result.is_alive = is_alive
+        result.tcp_ping = tcp_ping
 
         if not is_alive:
-            result['error'] = 'TCP连接失败'
+            result.error = 'TCP连接失败'
             return result
 
-        connector = aiohttp.TCPConnector(limit=1, ttl_dns_cache=300)
-        async with aiohttp.ClientSession(connector=connector) as session:
-
-            if test_mode in ['speed', 'full']:
-                result['http_ping'] = await http_speed_test(session)
-                result['download_speed'] = await download_speed_test(session)
-
-            if test_mode == 'full':
-                result['ip_info'] = await get_ip_info(session)
-                result['streaming'] = await test_streaming_unlock(session)
+        test_fn(result)
 
-        print(f"✅ 节点 {node['name']} 测试完成")
+        log(f"✅ 节点 {node['name']} 测试完成")
 
+    except LocalOverload:
+        # 交给调用方降低并发后重试，不能把节点记为失效
+        raise
     except Exception as e:
-        result['error'] = str(e)
-        print(f"❌ 节点 {node['name']} 测试失败: {e}")
+        result.error = str(e)
+        log(f"❌ 节点 {node['name']} 测试失败: {e}")
 
     return result
 
+# 根据本机过载错误（LOCAL_OVERLOAD_ERRNOS）调整并发上限：出现过载时收缩，持续正常后逐步放开
+# 节点失效本身不算过载信号；每次只根据上次调整之后新到的样本做决定
+async def adjust_concurrency(state, cond, max_cap, min_cap=5, interval=1.0, min_samples=10):
+    # 配置的上限比 min_cap 还小时，收缩不能反而把并发调大
+    min_cap = min(min_cap, max_cap)
+    while True:
+        await asyncio.sleep(interval)
+        samples = state['samples']
+        if len(samples) < min_samples:
+            continue
+        state['samples'] = []
+        overload_rate = sum(samples) / len(samples)
+        async with cond:
+            if overload_rate > 0.1:
+                state['cap'] = max(min_cap, state['cap'] * 3 // 4)
+            elif overload_rate == 0:
+                state['cap'] = min(max_cap, state['cap'] + 5)
+            cond.notify_all()
+
+def load_nodes(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
 async def main():
-    with open('raw_nodes.json', 'r', encoding='utf-8') as f:
-        nodes = json.load(f)
+    global _HTTP_PING, _DOWNLOAD_SPEED, _IP_INFO, _STREAMING, _LOG_QUEUE
+
+    # 本次运行的所有结果共用同一个测试开始时间
+    test_time = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    nodes = await asyncio.to_thread(load_nodes, 'raw_nodes.json')
 
     test_mode = os.environ.get('TEST_MODE', 'full')
+    test_fn = TEST_FUNCTIONS.get(test_mode, _test_tcp_only)
     print(f"📊 开始测试 {len(nodes)} 个节点，模式: {test_mode}")
 
-    semaphore = asyncio.Semaphore(3)
+    # 测试都是I/O等待，并发可以放宽；对公共测试地址的连接数由客户端连接池限制
+    # 用计数器 + Condition 做准入控制，运行中可以安全地调整并发上限
+    max_concurrency = int(os.environ.get('TEST_CONCURRENCY', '50'))
+    state = {'active': 0, 'cap': max_concurrency, 'samples': []}
+    cond = asyncio.Condition()
 
-    async def test_with_limit(node):
-        async with semaphore:
-            return await test_single_node(node, test_mode)
+    # 所有节点共用一个 HTTP/2 客户端，对同一测试地址的请求复用同一条TLS连接
+    # 节点本身只做TCP ping，HTTP请求都发往公共测试地址
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=15.0) as client:
 
-    start_time = time.time()
-    results = await asyncio.gather(*[test_with_limit(node) for node in nodes])
-    elapsed = time.time() - start_time
+        async def test_with_limit(node, max_attempts=3):
+            for _ in range(max_attempts):
+                async with cond:
+                    await cond.wait_for(lambda: state['active'] < state['cap'])
+                    state['active'] += 1
+                try:
+                    result = await test_single_node(node, test_fn, resolved_hosts, test_time)
+                    state['samples'].append(False)
+                    return result
+                except LocalOverload as e:
+                    state['samples'].append(True)
+                    overload = e
+                finally:
+                    async with cond:
+                        state['active'] -= 1
+                        cond.notify(1)
+                # 等并发上限收缩后再重试
+                await asyncio.sleep(1)
+
+            result = new_result(node, test_time)
+            result.error = f'本机资源不足: {overload}'
+            log(f"❌ 节点 {node['name']} 测试失败: {overload}")
+            return result
+
+        # 节点域名用 aiodns 解析，解析完即释放解析器
+        resolver = aiodns.DNSResolver()
+        try:
+            resolved_hosts = await resolve_hosts(resolver, {node['server'] for node in nodes})
+        finally:
+            await resolver.close()
+
+        # 客户端没有经过节点代理，延迟、测速、IP和流媒体检测的都是本机出口，整次运行只测一次
+        # 以后若通过节点代理转发，需要改为按 (server, port) 缓存
+        # 延迟和测速依次单独执行，不与其他请求争用本机带宽
+        if test_mode in TEST_FUNCTIONS:
+            _HTTP_PING = await http_speed_test(client)
+            _DOWNLOAD_SPEED = await download_speed_test(client)
+        if test_mode == 'full':
+            # 任一检测意外出错时保留默认值，不影响节点测试
+            ip_info, streaming = await asyncio.gather(
+                get_ip_info(client), test_streaming_unlock(client), return_exceptions=True
+            )
+            _IP_INFO = '未知' if isinstance(ip_info, BaseException) else ip_info
+            _STREAMING = {} if isinstance(streaming, BaseException) else streaming
+
+        _LOG_QUEUE = asyncio.Queue()
+        writer = asyncio.create_task(log_writer(_LOG_QUEUE))
+        adjuster = asyncio.create_task(adjust_concurrency(state, cond, max_concurrency))
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        async def test_indexed(index, node):
+            return index, await test_with_limit(node)
+
+        # 每个节点测完立即追加写入 test_results.jsonl，进程中途被终止也能保留已完成的结果
+        # test_results.json 中的结果按输入顺序排列
+        tasks = [asyncio.ensure_future(test_indexed(i, node)) for i, node in enumerate(nodes)]
+        results = [None] * len(nodes)
+        try:
+            with open('test_results.jsonl', 'wb') as f:
+                for next_result in asyncio.as_completed(tasks):
+                    index, result = await next_result
+                    results[index] = result
+                    f.write(orjson.dumps(result))
+                    f.write(b'\n')
+                    f.flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+            adjuster.cancel()
+            await _LOG_QUEUE.join()
+            writer.cancel()
+            _LOG_QUEUE = None
+        elapsed = loop.time() - start_time
 
     print(f"📊 测试完成，耗时 {elapsed:.2f} 秒")
 
-    alive_nodes = [r for r in results if r['is_alive']]
-    dead_nodes = [r for r in results if not r['is_alive']]
+    # 一次遍历同时完成存活分组、总体和分国家的延迟/速度累加
+    alive_nodes = []
+    dead_nodes = []
+    ping_sum = 0
+    speed_sum = 0
+    country_totals = defaultdict(lambda: {'total': 0, 'ping_sum': 0, 'speed_sum': 0})
+    for r in results:
+        if not r.is_alive:
+            dead_nodes.append(r)
+            continue
+        alive_nodes.append(r)
+        ping = r.tcp_ping if r.tcp_ping > 0 else 0
+        ping_sum += ping
+        speed_sum += r.download_speed
+        totals = country_totals[r.country]
+        totals['total'] += 1
+        totals['ping_sum'] += ping
+        totals['speed_sum'] += r.download_speed
 
     stats = {
-        'test_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'test_time': test_time,
         'test_mode': test_mode,
         'total_nodes': len(results),
         'alive_nodes': len(alive_nodes),
         'dead_nodes': len(dead_nodes),
         'success_rate': len(alive_nodes) / len(results) * 100 if results else 0,
-        'avg_tcp_ping': sum(r['tcp_ping'] for r in alive_nodes if r['tcp_ping'] > 0) / len(alive_nodes) if alive_nodes else 0,
-        'avg_download_speed': sum(r['download_speed'] for r in alive_nodes) / len(alive_nodes) if alive_nodes else 0
+        'avg_tcp_ping': ping_sum / len(alive_nodes) if alive_nodes else 0,
+        'avg_download_speed': speed_sum / len(alive_nodes) if alive_nodes else 0
     }
 
-    country_stats = {}
-    for result in alive_nodes:
-        country = result['country']
-        if country not in country_stats:
-            country_stats[country] = {'total': 0, 'avg_ping': 0, 'avg_speed': 0}
-        country_stats[country]['total'] += 1
+    country_stats = {
+        country: {
+            'total': totals['total'],
+            'avg_ping': totals['ping_sum'] / totals['total'],
+            'avg_speed': totals['speed_sum'] / totals['total']
+        }
+        for country, totals in country_totals.items()
+    }
 
     test_report = {
         'stats': stats,
@@ -178,8 +410,13 @@ async def main():
         'results': results
     }
 
-    with open('test_results.json', 'w', encoding='utf-8') as f:
-        json.dump(test_report, f, ensure_ascii=False, indent=2)
+    with open('test_results.json', 'wb') as f:
+        f.write(orjson.dumps(test_report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())